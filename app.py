@@ -1,13 +1,58 @@
-from flask import Flask, request, send_file, render_template_string, jsonify
+from flask import Flask, request, render_template_string, jsonify
 import pandas as pd
 import json
 import io
 import numpy as np
-from datetime import datetime
+import os
+import gzip
+import hashlib
+import zipfile
+import shutil
+import tempfile
+import contextlib
+import threading
+import math
+import uuid
+import time
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import sqlite3
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
+from fetch_assets import VENDOR_ASSETS, FONT_STYLESHEETS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_DECOMPRESSED_LENGTH'] = 256 * 1024 * 1024  # 256MB across all files inside compressed uploads
+app.config['PARSE_WORKERS'] = int(os.environ.get('PARSE_WORKERS', 4))  # 0 or 1 parses files inline
+app.config['PARSE_EXECUTOR'] = os.environ.get('PARSE_EXECUTOR', 'thread')  # 'process' forks a pool and copies uploads into it
+app.config['ADMISSION_MEMORY_BUDGET'] = int(os.environ.get('ADMISSION_MEMORY_BUDGET_MB', 1024)) * 1024 * 1024  # estimated peak memory across all workers
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 2))  # heavy requests running at once across all workers
+app.config['ADMISSION_QUEUE_SIZE'] = int(os.environ.get('ADMISSION_QUEUE_SIZE', 8))  # waiting requests before answering 503
+app.config['ADMISSION_QUEUE_TIMEOUT'] = int(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 30))  # seconds a request may wait
+app.config['ADMISSION_STATE_FILE'] = os.environ.get('ADMISSION_STATE_FILE', os.path.join(
+    tempfile.gettempdir(), f"claims-admission-{hashlib.sha256(app.root_path.encode('utf-8')).hexdigest()[:12]}.json"))  # shared by all workers on the host
+app.config['REFERENCE_DIR'] = os.environ.get('REFERENCE_DIR', '')  # server-side procedures/providers/facilities JSON
+app.config['REFERENCE_RELOAD_INTERVAL'] = int(os.environ.get('REFERENCE_RELOAD_INTERVAL', 10))  # seconds between change checks, 0 disables
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 60 * 60  # static asset URLs carry a content hash
+app.config['CLAIMS_DB_PATH'] = os.environ.get('CLAIMS_DB_PATH', '')  # empty disables the local claim store
+app.config['DEDUP_WITHIN_FILE'] = os.environ.get('DEDUP_WITHIN_FILE', '') == '1'  # also drop repeated line items inside one file
 
 def format_date(date_str, format_type):
     if pd.isna(date_str) or date_str == '':
@@ -89,68 +134,529 @@ def calculate_age(dob_str, service_date_str):
         print(f"Age calculation error: {e}, DOB={dob_str}, Service Date={service_date_str}")
         return ''
 
-def load_reference_data(files_data):
-    procedures_df = pd.DataFrame()
-    providers_df = pd.DataFrame()
-    facilities_df = pd.DataFrame()
-    
+parse_executor = None
+parse_executor_lock = threading.Lock()
+
+FILE_KEYWORDS = ('records', 'procedures', 'providers', 'facilities')
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+SPOOL_MEMORY_LIMIT = 8 * 1024 * 1024
+
+class DecompressedSizeExceeded(ValueError):
+    pass
+
+class DecompressionBudget:
+    # Shared by every stream of a request; files may be read from several threads
+    def __init__(self, limit):
+        self.limit = limit
+        self.remaining = limit
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        with self.lock:
+            self.remaining -= size
+            if self.remaining < 0:
+                raise DecompressedSizeExceeded(f"Decompressed upload size exceeds {self.limit} bytes")
+
+class LimitedReader(io.RawIOBase):
+    # Decompressing stream that charges every byte it yields to the request budget
+    def __init__(self, raw, budget):
+        self.raw = raw
+        self.budget = budget
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        self.budget.consume(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        chunks = []
+        while True:
+            chunk = self.read(DECOMPRESS_CHUNK_SIZE)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+def spool_stream(stream, stack):
+    # Workbooks and nested archives need random access; large ones spill to disk
+    spooled = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT))
+    shutil.copyfileobj(stream, spooled, DECOMPRESS_CHUNK_SIZE)
+    spooled.seek(0)
+    return spooled
+
+def open_content(file_content):
+    if isinstance(file_content, (bytes, bytearray)):
+        return io.BytesIO(file_content)
+    return file_content
+
+def add_expanded_file(expanded, filename, content):
+    stem, ext = os.path.splitext(filename)
+    unique_name = filename
+    suffix = 2
+    while unique_name in expanded:
+        unique_name = f"{stem}_{suffix}{ext}"
+        suffix += 1
+    expanded[unique_name] = content
+
+def expand_file(filename, content, expanded, budget, stack):
+    lower = filename.lower()
+    stream = open_content(content)
+    if lower.endswith('.zip'):
+        if not stream.seekable():
+            stream = spool_stream(stream, stack)
+        archive_stem = filename[:-len('.zip')]
+        archive = stack.enter_context(zipfile.ZipFile(stream))
+        for member in archive.infolist():
+            if member.is_dir() or member.filename.startswith('__MACOSX/'):
+                continue
+            inner_name = secure_filename(os.path.basename(member.filename))
+            if not inner_name:
+                continue
+            if not any(keyword in inner_name.lower() for keyword in FILE_KEYWORDS):
+                inner_name = f"{archive_stem}_{inner_name}"
+            member_stream = stack.enter_context(archive.open(member))
+            expand_file(inner_name, LimitedReader(member_stream, budget), expanded, budget, stack)
+    elif lower.endswith('.gz'):
+        member_stream = stack.enter_context(gzip.GzipFile(fileobj=stream))
+        expand_file(filename[:-len('.gz')], LimitedReader(member_stream, budget), expanded, budget, stack)
+    elif lower.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError(f"Cannot read {filename}: zstd support requires the zstandard package")
+        member_stream = stack.enter_context(zstandard.ZstdDecompressor().stream_reader(stream))
+        expand_file(filename[:-len('.zst')], LimitedReader(member_stream, budget), expanded, budget, stack)
+    else:
+        add_expanded_file(expanded, filename, content)
+
+def expand_compressed_files(files_data, stack):
+    # Compressed members become streams that decompress while they are parsed;
+    # they stay open until the caller's ExitStack closes.
+    expanded = {}
+    budget = DecompressionBudget(app.config['MAX_DECOMPRESSED_LENGTH'])
     for filename, file_content in files_data.items():
         try:
-            if 'procedures' in filename.lower() and filename.endswith('.json'):
-                procedures_data = json.loads(file_content.decode('utf-8'))
-                procedures_df = pd.DataFrame(procedures_data)
-            elif 'providers' in filename.lower() and filename.endswith('.json'):
-                providers_data = json.loads(file_content.decode('utf-8'))
-                providers_df = pd.DataFrame(providers_data)
-            elif 'facilities' in filename.lower() and filename.endswith('.json'):
-                facilities_data = json.loads(file_content.decode('utf-8'))
-                facilities_list = []
-                for fid, finfo in facilities_data.items():
-                    fac = {"id": fid}
-                    fac.update(finfo)
-                    if "address" in finfo:
-                        fac.update(finfo["address"])
-                    facilities_list.append(fac)
-                facilities_df = pd.DataFrame(facilities_list)
+            expand_file(filename, file_content, expanded, budget, stack)
+        except DecompressedSizeExceeded:
+            raise
         except Exception as e:
-            print(f"Error loading reference file {filename}: {e}")
-    
-    return procedures_df, providers_df, facilities_df
+            print(f"Error decompressing file {filename}: {e}")
+    return expanded
 
-def process_medical_claims(files_data, date_format='YYYY-MM-DD'):
-    records_df = None
-    patients_df = None
-    procedures_df, providers_df, facilities_df = load_reference_data(files_data)
+def parse_input_file(filename, file_content):
+    lower = filename.lower()
+    if 'procedures' in lower and filename.endswith('.json'):
+        procedures_data = json.load(open_content(file_content))
+        return [('procedures', pd.DataFrame(procedures_data))]
+    elif 'providers' in lower and filename.endswith('.json'):
+        providers_data = json.load(open_content(file_content))
+        return [('providers', pd.DataFrame(providers_data))]
+    elif 'facilities' in lower and filename.endswith('.json'):
+        facilities_data = json.load(open_content(file_content))
+        facilities_list = []
+        for fid, finfo in facilities_data.items():
+            fac = {"id": fid}
+            fac.update(finfo)
+            if "address" in finfo:
+                fac.update(finfo["address"])
+            facilities_list.append(fac)
+        return [('facilities', pd.DataFrame(facilities_list))]
+    elif 'records' in lower and filename.endswith('.xlsx'):
+        frames = []
+        workbook = open_content(file_content)
+        if not workbook.seekable():
+            with contextlib.ExitStack() as stack:
+                return parse_input_file(filename, spool_stream(workbook, stack))
+        with pd.ExcelFile(workbook) as excel_file:
+            for sheet_name in excel_file.sheet_names:
+                sheet_df = excel_file.parse(sheet_name)
+                if any(col.lower() in ['claim_id', 'cpt_code', 'charge_amount', 'rendering_npi'] for col in sheet_df.columns):
+                    frames.append(('records', sheet_df))
+                elif any(col.lower() in ['patient_id', 'first_name', 'last_name', 'dob'] for col in sheet_df.columns):
+                    frames.append(('patients', sheet_df))
+        return frames
+    elif 'records' in lower and filename.endswith('.csv'):
+        return [('records', pd.read_csv(open_content(file_content)))]
+    return []
 
-    for filename, file_content in files_data.items():
+def get_parse_executor():
+    global parse_executor
+    with parse_executor_lock:
+        if parse_executor is None:
+            if app.config['PARSE_EXECUTOR'] == 'process':
+                parse_executor = ProcessPoolExecutor(max_workers=app.config['PARSE_WORKERS'])
+            else:
+                parse_executor = ThreadPoolExecutor(max_workers=app.config['PARSE_WORKERS'], thread_name_prefix='parse')
+            print(f"Started {app.config['PARSE_EXECUTOR']} parse pool with {app.config['PARSE_WORKERS']} workers")
+        return parse_executor
+
+def discard_parse_executor(executor):
+    global parse_executor
+    with parse_executor_lock:
+        if parse_executor is executor:
+            parse_executor = None
+    executor.shutdown(wait=False)
+
+def parse_input_files(files_data):
+    # Files are independent, so they are parsed in parallel; the pool is created
+    # lazily so each forked gunicorn worker gets its own.
+    parsed = {}
+    if app.config['PARSE_EXECUTOR'] == 'process':
+        # Streams cannot be pickled, so process mode reads each file up front
+        materialized = {}
+        for filename, file_content in files_data.items():
+            try:
+                materialized[filename] = file_content if isinstance(file_content, (bytes, bytearray)) else file_content.read()
+            except DecompressedSizeExceeded:
+                raise
+            except Exception as e:
+                print(f"Error parsing file {filename}: {e}")
+        files_data = materialized
+    pending = dict(files_data)
+    if app.config['PARSE_WORKERS'] > 1 and len(files_data) > 1:
+        executor = get_parse_executor()
+        futures = {}
+        try:
+            for filename, file_content in files_data.items():
+                futures[filename] = executor.submit(parse_input_file, filename, file_content)
+            for filename, future in futures.items():
+                try:
+                    parsed[filename] = future.result()
+                except (BrokenProcessPool, DecompressedSizeExceeded):
+                    raise
+                except Exception as e:
+                    print(f"Error parsing file {filename}: {e}")
+                del pending[filename]
+        except BrokenProcessPool as e:
+            # A pool child died (e.g. OOM kill); replace the pool and finish this batch inline
+            print(f"Parse pool is broken ({e}), parsing {len(pending)} remaining files inline")
+            discard_parse_executor(executor)
+    for filename, file_content in pending.items():
+        try:
+            parsed[filename] = parse_input_file(filename, file_content)
+        except DecompressedSizeExceeded:
+            raise
+        except Exception as e:
+            print(f"Error parsing file {filename}: {e}")
+    return {filename: parsed[filename] for filename in files_data if filename in parsed}
+
+def collect_reference_data(parsed):
+    # Several files of one kind (e.g. providers_east.json, providers_west.json)
+    # are concatenated; on duplicate keys the first file in order wins
+    frames = {'procedures': [], 'providers': [], 'facilities': []}
+    for file_frames in parsed.values():
+        for kind, df in file_frames:
+            if kind in frames:
+                frames[kind].append(df)
+    return tuple(pd.concat(frames[kind], ignore_index=True) if frames[kind] else pd.DataFrame()
+                 for kind in ('procedures', 'providers', 'facilities'))
+
+def index_rows(df, key):
+    if df.empty or key not in df.columns:
+        return {}
+    first_rows = df.drop_duplicates(key)
+    return dict(zip(first_rows[key], first_rows.to_dict('records')))
+
+def build_reference_data(procedures_df, providers_df, facilities_df):
+    return {
+        'procedures': procedures_df,
+        'providers': providers_df,
+        'facilities': facilities_df,
+        'procedures_by_code': index_rows(procedures_df, 'code'),
+        'providers_by_npi': index_rows(providers_df, 'npi'),
+        'facilities_by_id': index_rows(facilities_df, 'id')
+    }
+
+reference_registry = {'version': 0, 'loaded_at': None, 'signature': (), 'data': None}
+reference_registry_lock = threading.Lock()
+reference_watcher_pid = None
+
+def reference_dir_signature(directory):
+    signature = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith('.json'):
+            stat = os.stat(os.path.join(directory, name))
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def load_reference_registry(directory):
+    # The new registry is built completely before it replaces the old one, so
+    # requests always see a single consistent version.
+    global reference_registry
+    signature = reference_dir_signature(directory)
+    if signature == reference_registry['signature']:
+        return False
+    parsed = {}
+    for name, _, _ in signature:
+        with open(os.path.join(directory, name), 'rb') as f:
+            parsed[name] = parse_input_file(name, f.read())
+    data = build_reference_data(*collect_reference_data(parsed))
+    with reference_registry_lock:
+        reference_registry = {
+            'version': reference_registry['version'] + 1,
+            'loaded_at': datetime.now().isoformat(timespec='seconds'),
+            'signature': signature,
+            'data': data
+        }
+    print(f"Loaded reference registry v{reference_registry['version']} from {directory}: "
+          f"{len(data['procedures'])} procedures, {len(data['providers'])} providers, {len(data['facilities'])} facilities")
+    return True
+
+def watch_reference_registry(directory, interval):
+    while True:
+        time.sleep(interval)
         try:
-            if 'records' in filename.lower() and (filename.endswith('.xlsx') or filename.endswith('.csv')):
-                if filename.endswith('.xlsx'):
-                    excel_file = pd.ExcelFile(io.BytesIO(file_content))
-                    for sheet_name in excel_file.sheet_names:
-                        sheet_df = pd.read_excel(io.BytesIO(file_content), sheet_name=sheet_name)
-                        if any(col.lower() in ['claim_id', 'cpt_code', 'charge_amount', 'rendering_npi'] for col in sheet_df.columns):
-                            records_df = sheet_df
-                        elif any(col.lower() in ['patient_id', 'first_name', 'last_name', 'dob'] for col in sheet_df.columns):
-                            patients_df = sheet_df
-                else:
-                    records_df = pd.read_csv(io.BytesIO(file_content))
+            load_reference_registry(directory)
         except Exception as e:
-            print(f"Error processing file {filename}: {e}")
+            print(f"Error reloading reference registry from {directory}: {e}")
+
+def start_reference_watcher():
+    # Threads do not survive fork, so each worker starts its own watcher
+    global reference_watcher_pid
+    directory = app.config['REFERENCE_DIR']
+    interval = app.config['REFERENCE_RELOAD_INTERVAL']
+    if not directory or interval <= 0 or reference_watcher_pid == os.getpid():
+        return
+    with reference_registry_lock:
+        if reference_watcher_pid == os.getpid():
+            return
+        reference_watcher_pid = os.getpid()
+    threading.Thread(target=watch_reference_registry, args=(directory, interval), daemon=True).start()
+
+def resolve_reference_data(procedures_df, providers_df, facilities_df):
+    # Uploaded reference files take precedence; missing ones come from the registry
+    registry = reference_registry['data']
+    if registry is None:
+        return build_reference_data(procedures_df, providers_df, facilities_df)
+    reference = {}
+    for kind, df, index_name, key in [('procedures', procedures_df, 'procedures_by_code', 'code'),
+                                      ('providers', providers_df, 'providers_by_npi', 'npi'),
+                                      ('facilities', facilities_df, 'facilities_by_id', 'id')]:
+        if df.empty:
+            reference[kind] = registry[kind]
+            reference[index_name] = registry[index_name]
+        else:
+            reference[kind] = df
+            reference[index_name] = index_rows(df, key)
+    return reference
+
+if app.config['REFERENCE_DIR']:
+    try:
+        load_reference_registry(app.config['REFERENCE_DIR'])
+    except Exception as e:
+        print(f"Error loading reference registry from {app.config['REFERENCE_DIR']}: {e}")
+
+# Filter parameters shared by /preview, /process and /claims; lists are comma-separated
+FILTER_FIELDS = {
+    'date_from': 'date',
+    'date_to': 'date',
+    'state': 'list',
+    'specialty': 'list',
+    'cpt_code': 'list',
+    'claim_id': 'list',
+    'patient': 'list'
+}
+
+class InvalidFilter(ValueError):
+    pass
+
+def parse_date(date_str):
+    if pd.isna(date_str) or date_str == '':
+        return None
+    if isinstance(date_str, str):
+        for fmt in ['%m/%d/%Y', '%m-%d-%Y', '%Y-%m-%d', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S']:
+            try:
+                return datetime.strptime(date_str, fmt)
+            except ValueError:
+                continue
+    dt = pd.to_datetime(date_str, errors='coerce')
+    return None if pd.isna(dt) else dt.to_pydatetime()
+
+def parse_filters(form):
+    filters = {}
+    for field, kind in FILTER_FIELDS.items():
+        value = form.get(field, '').strip()
+        if not value:
             continue
+        if kind == 'date':
+            try:
+                filters[field] = parse_date(value)
+            except (ValueError, OverflowError):
+                filters[field] = None
+            if filters[field] is None:
+                raise InvalidFilter(f"Invalid {field}: {value}")
+        else:
+            items = [item.strip() for item in value.split(',') if item.strip()]
+            if items:
+                filters[field] = items
+    if filters.get('date_from') and filters.get('date_to') and filters['date_from'] > filters['date_to']:
+        raise InvalidFilter('date_from must not be after date_to')
+    return filters or None
 
-    if records_df is None:
-        raise ValueError("Records Excel/CSV file is required")
+def filter_providers(providers_df, facilities_df, filters):
+    # Reference-based filters reduce to the set of NPIs whose provider matches
+    # A filter on a column the reference data does not have matches nothing
+    providers = providers_df
+    if 'npi' not in providers.columns:
+        return set()
+    if filters.get('specialty'):
+        if 'specialty' not in providers.columns:
+            return set()
+        specialties = {s.lower() for s in filters['specialty']}
+        providers = providers[providers['specialty'].astype(str).str.strip().str.lower().isin(specialties)]
+    if filters.get('state'):
+        states = {s.upper() for s in filters['state']}
+        if (facilities_df.empty or 'state' not in facilities_df.columns or 'id' not in facilities_df.columns
+                or 'facility_id' not in providers.columns):
+            return set()
+        facility_ids = facilities_df.loc[facilities_df['state'].astype(str).str.strip().str.upper().isin(states), 'id']
+        providers = providers[providers['facility_id'].isin(facility_ids)]
+    return set(providers['npi'].astype(str))
+
+def apply_claim_filters(records_df, patients_df, providers_df, facilities_df, claim_id_col, filters):
+    # Applied before grouping so per-claim work only covers the selected slice.
+    # Filters keep or drop whole claims, leaving totals and start dates intact.
+    # A filter whose column is missing from the records matches nothing.
+    before = records_df[claim_id_col].nunique()
+    if filters.get('claim_id'):
+        claim_ids = set(filters['claim_id'])
+        records_df = records_df[records_df[claim_id_col].astype(str).isin(claim_ids)]
+
+    record_patient_col = next((col for col in records_df.columns if 'patient' in col.lower() and 'id' in col.lower()), None)
+    if filters.get('patient'):
+        if record_patient_col is None:
+            records_df = records_df.iloc[0:0]
+        else:
+            patient_ids = set(filters['patient'])
+            records_df = records_df[records_df[record_patient_col].astype(str).str.strip().isin(patient_ids)]
+
+    cpt_col = next((col for col in records_df.columns if 'cpt' in col.lower() and 'code' in col.lower()), None)
+    if filters.get('cpt_code') and cpt_col is None:
+        records_df = records_df.iloc[0:0]
+    elif filters.get('cpt_code'):
+        cpt_codes = set(filters['cpt_code'])
+        matching = records_df.loc[records_df[cpt_col].astype(str).str.strip().isin(cpt_codes), claim_id_col].unique()
+        records_df = records_df[records_df[claim_id_col].isin(matching)]
+
+    service_date_col = next((col for col in records_df.columns if 'date' in col.lower() and 'service' in col.lower()), None)
+    if (filters.get('date_from') or filters.get('date_to')) and service_date_col is None:
+        records_df = records_df.iloc[0:0]
+    elif filters.get('date_from') or filters.get('date_to'):
+        start_dates = records_df.groupby(claim_id_col)[service_date_col].min()
+        parsed_dates = {value: parse_date(value) for value in start_dates.dropna().unique()}
+        keep = start_dates.map(lambda value: parsed_dates.get(value) if pd.notna(value) else None).dropna()
+        if filters.get('date_from'):
+            keep = keep[keep >= filters['date_from']]
+        if filters.get('date_to'):
+            keep = keep[keep <= filters['date_to']]
+        records_df = records_df[records_df[claim_id_col].isin(keep.index)]
+
+    provider_npi_col = next((col for col in records_df.columns if 'npi' in col.lower()), None)
+    if filters.get('state') or filters.get('specialty'):
+        if provider_npi_col is None or providers_df.empty:
+            records_df = records_df.iloc[0:0]
+        else:
+            allowed_npis = filter_providers(providers_df, facilities_df, filters)
+            first_rows = records_df.drop_duplicates(claim_id_col)
+            first_npis = first_rows[provider_npi_col].map(lambda npi: str(npi).strip() if pd.notna(npi) else None)
+            matching = first_rows.loc[first_npis.isin(allowed_npis), claim_id_col]
+            records_df = records_df[records_df[claim_id_col].isin(matching)]
 
-    records_df.columns = records_df.columns.str.strip()
     if patients_df is not None:
-        patients_df.columns = patients_df.columns.str.strip()
+        patient_id_col = next((col for col in patients_df.columns if 'patient' in col.lower() and 'id' in col.lower()), None)
+        if record_patient_col and patient_id_col:
+            patients_df = patients_df[patients_df[patient_id_col].isin(records_df[record_patient_col].unique())]
+
+    print(f"Filters kept {records_df[claim_id_col].nunique()} of {before} claims")
+    return records_df, patients_df
+
+LINE_ITEM_KEY_COLUMNS = [
+    ('claim_id', lambda col: 'claim' in col.lower() and 'id' in col.lower()),
+    ('cpt_code', lambda col: 'cpt' in col.lower() and 'code' in col.lower()),
+    ('service_date', lambda col: 'date' in col.lower() and 'service' in col.lower()),
+    ('charge_amount', lambda col: 'charge' in col.lower() and 'amount' in col.lower()),
+    ('npi', lambda col: 'npi' in col.lower())
+]
+
+def normalize_key_column(series, kind):
+    if kind == 'charge_amount':
+        # Always float so '$5' and '5.00' hash the same across files
+        return pd.to_numeric(series.astype(str).str.replace(r'[\$,]', '', regex=True), errors='coerce').astype(float).round(2)
+    if kind == 'service_date':
+        parsed_dates = {}
+        for value in series.dropna().unique():
+            dt = parse_date(value)
+            parsed_dates[value] = dt.strftime('%Y-%m-%d') if dt else str(value).strip()
+        return series.map(parsed_dates).fillna('')
+    return series.astype(str).str.strip().str.upper()
+
+def merge_records(frames, dedup_within_file=False):
+    # A line item is dropped when a 64-bit hash of its normalized key columns
+    # already appeared in an earlier source. Repeats inside one file can be
+    # legitimate (e.g. two identical units billed) and are kept unless asked.
+    seen_hashes = pd.Index([], dtype='uint64')
+    merged = []
+    duplicates = 0
+    for df in frames:
+        key_columns = {}
+        for kind, matches in LINE_ITEM_KEY_COLUMNS:
+            col = next((col for col in df.columns if matches(col)), None)
+            if col is not None:
+                key_columns[kind] = normalize_key_column(df[col], kind)
+        if not key_columns:
+            merged.append(df)
+            continue
+        hashes = pd.util.hash_pandas_object(pd.DataFrame(key_columns), index=False)
+        keep = ~hashes.isin(seen_hashes)
+        if dedup_within_file:
+            keep &= ~hashes.duplicated()
+        duplicates += int((~keep).sum())
+        merged.append(df[keep.values])
+        seen_hashes = seen_hashes.append(pd.Index(hashes.unique())).unique()
+    records_df = pd.concat(merged, ignore_index=True) if len(merged) > 1 else merged[0]
+    return records_df, duplicates
+
+def process_medical_claims(files_data, date_format='YYYY-MM-DD', filters=None):
+    records_frames = []
+    patients_frames = []
+    with contextlib.ExitStack() as stack:
+        files_data = expand_compressed_files(files_data, stack)
+        parsed = parse_input_files(files_data)
+    reference = resolve_reference_data(*collect_reference_data(parsed))
+
+    for file_frames in parsed.values():
+        for kind, df in file_frames:
+            df.columns = df.columns.str.strip()
+            if kind == 'records':
+                records_frames.append(df)
+            elif kind == 'patients':
+                patients_frames.append(df)
+
+    if not records_frames:
+        raise ValueError("Records Excel/CSV file is required")
+
+    records_df, duplicate_line_items = merge_records(records_frames, app.config['DEDUP_WITHIN_FILE'])
+    line_items = len(records_df)
+    print(f"Merged {len(records_frames)} records sheets/files: {line_items} line items, {duplicate_line_items} duplicates removed")
+
+    patients_df = None
+    if patients_frames:
+        patients_df = pd.concat(patients_frames, ignore_index=True) if len(patients_frames) > 1 else patients_frames[0]
+        patient_id_col = next((col for col in patients_df.columns if 'patient' in col.lower() and 'id' in col.lower()), None)
+        if patient_id_col and len(patients_frames) > 1:
+            patients_df = patients_df.drop_duplicates(patient_id_col, keep='last')
 
     claim_id_col = next((col for col in records_df.columns if 'claim' in col.lower() and 'id' in col.lower()), None)
     if not claim_id_col:
         raise ValueError("Could not find claim_id column in records data")
 
+    if filters:
+        records_df, patients_df = apply_claim_filters(records_df, patients_df, reference['providers'], reference['facilities'], claim_id_col, filters)
+
     consolidated_claims = []
+    claim_patient_ids = {}
     for claim_id, group in records_df.groupby(claim_id_col):
         try:
             first_row = group.iloc[0]
@@ -190,12 +696,12 @@ def process_medical_claims(files_data, date_format='YYYY-MM-DD'):
 
             procedure_code_col = next((col for col in records_df.columns if 'cpt' in col.lower() and 'code' in col.lower()), None)
             procedure_descriptions = []
-            if procedure_code_col and not procedures_df.empty:
+            if procedure_code_col and reference['procedures_by_code']:
                 procedure_codes = group[procedure_code_col].dropna().astype(str).str.strip().unique()
                 for proc_code in procedure_codes:
-                    proc_info = procedures_df[procedures_df['code'] == proc_code]
-                    if not proc_info.empty:
-                        desc = proc_info.iloc[0]['description']
+                    proc_info = reference['procedures_by_code'].get(proc_code)
+                    if proc_info is not None:
+                        desc = proc_info.get('description')
                         if pd.notna(desc):
                             procedure_descriptions.append(str(desc))
 
@@ -203,23 +709,23 @@ def process_medical_claims(files_data, date_format='YYYY-MM-DD'):
             provider_name = ''
             provider_specialty = ''
             facility_id = ''
-            if provider_npi_col and not providers_df.empty:
+            if provider_npi_col and reference['providers_by_npi']:
                 provider_npi = first_row[provider_npi_col]
                 if pd.notna(provider_npi):
                     provider_npi_str = str(provider_npi).strip()
-                    provider_info = providers_df[providers_df['npi'] == provider_npi_str]
-                    if not provider_info.empty:
-                        provider_name = str(provider_info.iloc[0]['name'])
-                        provider_specialty = str(provider_info.iloc[0]['specialty'])
-                        facility_id = provider_info.iloc[0].get('facility_id', '')
+                    provider_info = reference['providers_by_npi'].get(provider_npi_str)
+                    if provider_info is not None:
+                        provider_name = str(provider_info['name'])
+                        provider_specialty = str(provider_info['specialty'])
+                        facility_id = provider_info.get('facility_id', '')
 
             facility_state = ''
             facility_name = ''
-            if facility_id and not facilities_df.empty:
-                facility_info = facilities_df[facilities_df['id'] == facility_id]
-                if not facility_info.empty:
-                    facility_state = str(facility_info.iloc[0].get('state', ''))
-                    facility_name = str(facility_info.iloc[0].get('name', ''))
+            if facility_id and reference['facilities_by_id']:
+                facility_info = reference['facilities_by_id'].get(facility_id)
+                if facility_info is not None:
+                    facility_state = str(facility_info.get('state', ''))
+                    facility_name = str(facility_info.get('name', ''))
 
             consolidated_claim = {
                 'Claim ID': str(claim_id),
@@ -236,12 +742,18 @@ def process_medical_claims(files_data, date_format='YYYY-MM-DD'):
                 'Facility Name': facility_name
             }
             consolidated_claims.append(consolidated_claim)
+            if patient_id is not None:
+                claim_patient_ids[str(claim_id)] = str(patient_id)
             print(f"Processed claim {claim_id} with Age: {age}")
         except Exception as e:
             print(f"Error processing claim {claim_id}: {e}")
             continue
 
     result_df = pd.DataFrame(consolidated_claims)
+    result_df.attrs['patient_ids'] = claim_patient_ids
+    result_df.attrs['records_sources'] = len(records_frames)
+    result_df.attrs['line_items'] = line_items
+    result_df.attrs['duplicate_line_items'] = duplicate_line_items
     print("Columns in output DataFrame:", result_df.columns.tolist())
     return result_df
 
@@ -254,7 +766,10 @@ def calculate_claim_analytics(records_df):
         'claims_by_specialty': {},
         'top_procedures': [],
         'claims_by_gender': {},
-        'claims_by_state': {}
+        'claims_by_state': {},
+        'records_sources': records_df.attrs.get('records_sources', 0),
+        'line_items': records_df.attrs.get('line_items', 0),
+        'duplicate_line_items': records_df.attrs.get('duplicate_line_items', 0)
     }
     
     if 'Total Charge Amount' in records_df.columns:
@@ -285,6 +800,182 @@ def calculate_claim_analytics(records_df):
     
     return analytics
 
+CLAIM_STORE_COLUMNS = {
+    'Claim ID': 'claim_id',
+    'Patient Name': 'patient_name',
+    'Date of Birth': 'date_of_birth',
+    'Gender': 'gender',
+    'Age': 'age',
+    'Total Charge Amount': 'total_charge',
+    'Starting Service Date': 'service_date',
+    'Procedure Descriptions': 'procedure_descriptions',
+    'Rendering Provider Name': 'provider_name',
+    'Provider Specialty': 'provider_specialty',
+    'Facility State': 'facility_state',
+    'Facility Name': 'facility_name'
+}
+
+CLAIM_STORE_GROUPS = {
+    'state': 'facility_state',
+    'specialty': 'provider_specialty',
+    'gender': 'gender',
+    'patient': 'patient_id',
+    'month': "substr(service_date, 1, 7)"
+}
+
+DATE_FORMAT_PATTERNS = {
+    'YYYY-MM-DD': '%Y-%m-%d',
+    'MM/DD/YYYY': '%m/%d/%Y',
+    'DD/MM/YYYY': '%d/%m/%Y'
+}
+
+claims_db_initialized = set()
+claims_db_lock = threading.Lock()
+
+def init_claims_db(conn):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS claims (
+            claim_id TEXT PRIMARY KEY,
+            patient_id TEXT,
+            patient_name TEXT,
+            date_of_birth TEXT,
+            gender TEXT,
+            age INTEGER,
+            total_charge REAL,
+            service_date TEXT,
+            procedure_descriptions TEXT,
+            provider_name TEXT,
+            provider_specialty TEXT,
+            facility_state TEXT,
+            facility_name TEXT,
+            loaded_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claims_service_date ON claims (service_date)')
+    # State and specialty filters match case-insensitively, so their indexes use NOCASE
+    conn.execute('DROP INDEX IF EXISTS idx_claims_state_date')
+    conn.execute('DROP INDEX IF EXISTS idx_claims_specialty_date')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claims_state_nocase_date ON claims (facility_state COLLATE NOCASE, service_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claims_specialty_nocase_date ON claims (provider_specialty COLLATE NOCASE, service_date)')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(claims)')}
+    if 'patient_id' not in columns:
+        conn.execute('ALTER TABLE claims ADD COLUMN patient_id TEXT')
+    conn.execute('DROP INDEX IF EXISTS idx_claims_patient')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_claims_patient_id ON claims (patient_id)')
+    conn.commit()
+
+def get_claims_db():
+    db_path = app.config.get('CLAIMS_DB_PATH')
+    if not db_path:
+        return None
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # Schema setup runs once per process and database path, not on every query
+    if db_path not in claims_db_initialized:
+        with claims_db_lock:
+            if db_path not in claims_db_initialized:
+                try:
+                    init_claims_db(conn)
+                except sqlite3.Error:
+                    conn.close()
+                    raise
+                claims_db_initialized.add(db_path)
+    return conn
+
+def to_iso_date(date_str, date_format):
+    if pd.isna(date_str) or date_str == '':
+        return None
+    try:
+        return datetime.strptime(str(date_str), DATE_FORMAT_PATTERNS.get(date_format, '%Y-%m-%d')).strftime('%Y-%m-%d')
+    except ValueError:
+        dt = pd.to_datetime(date_str, errors='coerce')
+        return None if pd.isna(dt) else dt.strftime('%Y-%m-%d')
+
+def persist_claims(result_df, date_format='YYYY-MM-DD'):
+    conn = get_claims_db()
+    if conn is None or result_df.empty:
+        return 0
+    loaded_at = datetime.now().isoformat(timespec='seconds')
+    patient_ids = result_df.attrs.get('patient_ids', {})
+    rows = []
+    for claim in result_df.to_dict('records'):
+        row = {CLAIM_STORE_COLUMNS[col]: claim.get(col, '') for col in CLAIM_STORE_COLUMNS}
+        row['patient_id'] = patient_ids.get(row['claim_id'])
+        try:
+            row['total_charge'] = float(str(row['total_charge']).replace('$', '').replace(',', ''))
+        except ValueError:
+            row['total_charge'] = 0.0
+        row['age'] = int(row['age']) if str(row['age']).isdigit() else None
+        row['facility_state'] = str(row['facility_state']).strip()
+        row['provider_specialty'] = str(row['provider_specialty']).strip()
+        row['service_date'] = to_iso_date(row['service_date'], date_format)
+        row['date_of_birth'] = to_iso_date(row['date_of_birth'], date_format)
+        row['loaded_at'] = loaded_at
+        rows.append(row)
+    columns = list(rows[0].keys())
+    try:
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO claims ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})",
+                rows
+            )
+        print(f"Persisted {len(rows)} claims to {app.config['CLAIMS_DB_PATH']}")
+    finally:
+        conn.close()
+    return len(rows)
+
+def build_claims_filter(filters):
+    # Same parsed filters as the upload routes; matching mirrors apply_claim_filters
+    filters = filters or {}
+    if filters.get('cpt_code'):
+        raise InvalidFilter('cpt_code is not supported by the claim store (line items are not stored)')
+    clauses = []
+    params = []
+    # Bare columns (values are stripped on write) so the NOCASE indexes apply
+    for key, column in [('claim_id', 'claim_id'), ('patient', 'patient_id'),
+                        ('state', 'facility_state COLLATE NOCASE'),
+                        ('specialty', 'provider_specialty COLLATE NOCASE')]:
+        if filters.get(key):
+            clauses.append(f"{column} IN ({', '.join('?' for _ in filters[key])})")
+            params.extend(filters[key])
+    if filters.get('date_from'):
+        clauses.append('service_date >= ?')
+        params.append(filters['date_from'].strftime('%Y-%m-%d'))
+    if filters.get('date_to'):
+        clauses.append('service_date <= ?')
+        params.append(filters['date_to'].strftime('%Y-%m-%d'))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    return where, params
+
+def query_claims(conn, filters, page=1, per_page=50):
+    where, params = build_claims_filter(filters)
+    total = conn.execute(f'SELECT COUNT(*) FROM claims {where}', params).fetchone()[0]
+    rows = conn.execute(
+        f'SELECT * FROM claims {where} ORDER BY service_date, claim_id LIMIT ? OFFSET ?',
+        params + [per_page, (page - 1) * per_page]
+    ).fetchall()
+    return {
+        'claims': [dict(row) for row in rows],
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': (total + per_page - 1) // per_page
+    }
+
+def aggregate_claims(conn, filters, group_by):
+    where, params = build_claims_filter(filters)
+    key = CLAIM_STORE_GROUPS[group_by]
+    rows = conn.execute(
+        f'SELECT {key} AS group_key, COUNT(*) AS claims, ROUND(SUM(total_charge), 2) AS total_amount '
+        f'FROM claims {where} GROUP BY group_key ORDER BY claims DESC',
+        params
+    ).fetchall()
+    return {
+        'group_by': group_by,
+        'groups': [{'key': row['group_key'], 'claims': row['claims'], 'total_amount': row['total_amount']} for row in rows]
+    }
+
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="en">
@@ -292,11 +983,11 @@ HTML_TEMPLATE = """
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Medical Claims Processor</title>
-    <script src="https://cdn.tailwindcss.com"></script>
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/materialize/1.0.0/css/materialize.min.css" rel="stylesheet">
-    <link href="https://fonts.googleapis.com/icon?family=Material+Icons" rel="stylesheet">
-    <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@400;600;700&display=swap" rel="stylesheet">
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+    <script src="{{ asset('vendor/tailwindcss.js') }}"></script>
+    <link href="{{ asset('vendor/materialize.min.css') }}" rel="stylesheet">
+    <link href="{{ asset('vendor/material-icons.css') }}" rel="stylesheet">
+    <link href="{{ asset('vendor/poppins.css') }}" rel="stylesheet">
+    <script src="{{ asset('vendor/chart.umd.min.js') }}"></script>
     <style>
         body { font-family: 'Poppins', sans-serif; }
         .gradient-bg { background: linear-gradient(135deg, #4f46e5 0%, #7c3aed 100%); }
@@ -329,8 +1020,8 @@ HTML_TEMPLATE = """
                 <div class="upload-zone rounded-xl p-8 text-center bg-white bg-opacity-10" id="uploadZone" ondrop="dropHandler(event);" ondragover="dragOverHandler(event);" ondragleave="dragLeaveHandler(event);">
                     <i class="material-icons text-6xl text-white mb-4">cloud_upload</i>
                     <h3 class="text-xl font-semibold text-white mb-2">Drop files here or select below</h3>
-                    <p class="text-white text-opacity-70 mb-4">Supports Excel (.xlsx), JSON, and CSV files</p>
-                    <input type="file" id="fileInput" multiple accept=".xlsx,.json,.csv" class="file-input w-full mb-4" onchange="handleFileSelect(event)">
+                    <p class="text-white text-opacity-70 mb-4">Supports Excel (.xlsx), JSON, and CSV files, plain or compressed (.gz, .zip, .zst)</p>
+                    <input type="file" id="fileInput" multiple accept=".xlsx,.json,.csv,.gz,.zip,.zst" class="file-input w-full mb-4" onchange="handleFileSelect(event)">
                     <button class="btn-large waves-effect waves-light bg-indigo-600 hover:bg-indigo-700" onclick="triggerFileInput()">
                         <i class="material-icons left">attach_file</i>Choose Files
                     </button>
@@ -364,6 +1055,33 @@ HTML_TEMPLATE = """
                         </select>
                     </div>
                 </div>
+                <h5 class="text-lg font-semibold text-white mb-2">Filters <span class="text-sm text-white text-opacity-70">(optional, comma-separated lists)</span></h5>
+                <div class="row mb-4">
+                    <div class="col s12 m6 l2">
+                        <label class="text-white">Service Date From</label>
+                        <input type="date" data-filter="date_from" class="browser-default white-text bg-black bg-opacity-20 rounded p-2 mt-2 w-full">
+                    </div>
+                    <div class="col s12 m6 l2">
+                        <label class="text-white">Service Date To</label>
+                        <input type="date" data-filter="date_to" class="browser-default white-text bg-black bg-opacity-20 rounded p-2 mt-2 w-full">
+                    </div>
+                    <div class="col s12 m6 l2">
+                        <label class="text-white">Facility States</label>
+                        <input type="text" data-filter="state" placeholder="CA, NY" class="browser-default white-text bg-black bg-opacity-20 rounded p-2 mt-2 w-full">
+                    </div>
+                    <div class="col s12 m6 l2">
+                        <label class="text-white">Provider Specialties</label>
+                        <input type="text" data-filter="specialty" placeholder="Cardiology" class="browser-default white-text bg-black bg-opacity-20 rounded p-2 mt-2 w-full">
+                    </div>
+                    <div class="col s12 m6 l2">
+                        <label class="text-white">CPT Codes</label>
+                        <input type="text" data-filter="cpt_code" placeholder="99213, 93000" class="browser-default white-text bg-black bg-opacity-20 rounded p-2 mt-2 w-full">
+                    </div>
+                    <div class="col s12 m6 l2">
+                        <label class="text-white">Claim IDs</label>
+                        <input type="text" data-filter="claim_id" class="browser-default white-text bg-black bg-opacity-20 rounded p-2 mt-2 w-full">
+                    </div>
+                </div>
                 <div class="text-center space-x-4">
                     <button id="processBtn" class="btn-large waves-effect waves-light bg-green-600 hover:bg-green-700 disabled:opacity-50" onclick="processFiles()" disabled>
                         <i class="material-icons left">play_arrow</i>Process Files
@@ -388,6 +1106,7 @@ HTML_TEMPLATE = """
                                     <th>Total Patients</th>
                                     <th>Total Amount</th>
                                     <th>Date Range</th>
+                                    <th>Duplicate Line Items</th>
                                 </tr>
                             </thead>
                             <tbody>
@@ -396,6 +1115,7 @@ HTML_TEMPLATE = """
                                     <td id="totalPatients"></td>
                                     <td id="totalAmount"></td>
                                     <td id="dateRange"></td>
+                                    <td id="duplicateLineItems"></td>
                                 </tr>
                             </tbody>
                         </table>
@@ -431,7 +1151,7 @@ HTML_TEMPLATE = """
         </div>
     </div>
     <div id="toast-container"></div>
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/materialize/1.0.0/js/materialize.min.js"></script>
+    <script src="{{ asset('vendor/materialize.min.js') }}"></script>
     <script>
         let uploadedFiles = [];
         let charts = {
@@ -447,7 +1167,10 @@ HTML_TEMPLATE = """
             const typeMap = {
                 'xlsx': { type: 'Excel', color: 'green', icon: 'table_chart' },
                 'json': { type: 'JSON', color: 'orange', icon: 'code' },
-                'csv': { type: 'CSV', color: 'blue', icon: 'description' }
+                'csv': { type: 'CSV', color: 'blue', icon: 'description' },
+                'gz': { type: 'Gzip', color: 'purple', icon: 'archive' },
+                'zip': { type: 'Zip', color: 'purple', icon: 'archive' },
+                'zst': { type: 'Zstd', color: 'purple', icon: 'archive' }
             };
             return typeMap[extension] || { type: 'Unknown', color: 'grey', icon: 'help' };
         }
@@ -542,6 +1265,14 @@ HTML_TEMPLATE = """
             }
             console.log('Process button state:', !hasFiles ? 'disabled' : 'enabled');
         }
+        function appendFilters(formData) {
+            document.querySelectorAll('[data-filter]').forEach(input => {
+                const value = input.value.trim();
+                if (value) {
+                    formData.append(input.dataset.filter, value);
+                }
+            });
+        }
         async function previewData() {
             if (isPreviewLoading) {
                 console.log('Preview already in progress, ignoring click');
@@ -574,6 +1305,7 @@ HTML_TEMPLATE = """
                 formData.append('files', file);
                 console.log('Appending file to formData:', file.name);
             });
+            appendFilters(formData);
 
             try {
                 console.log('Fetching preview data');
@@ -590,6 +1322,7 @@ HTML_TEMPLATE = """
                 document.getElementById('totalPatients').textContent = data.total_patients || 'N/A';
                 document.getElementById('dateRange').textContent = data.date_range || 'N/A';
                 document.getElementById('totalAmount').textContent = data.total_amount || 'N/A';
+                document.getElementById('duplicateLineItems').textContent = `${data.duplicate_line_items ?? 0} of ${data.line_items + (data.duplicate_line_items ?? 0)} (${data.records_sources ?? 0} sources)`;
 
                 // Update sample claims table with N/A for empty values
                 if (data.sample_claims && data.sample_claims.length > 0) {
@@ -735,6 +1468,7 @@ HTML_TEMPLATE = """
                 document.getElementById('totalPatients').textContent = 'Error';
                 document.getElementById('dateRange').textContent = 'Error';
                 document.getElementById('totalAmount').textContent = 'Error';
+                document.getElementById('duplicateLineItems').textContent = 'Error';
                 document.getElementById('tableHeaders').innerHTML = '<th>Error</th>';
                 document.getElementById('tableBody').innerHTML = '<tr><td>Failed to load data</td></tr>';
                 M.toast({html: 'Error: ' + error.message, classes: 'red'});
@@ -756,6 +1490,7 @@ HTML_TEMPLATE = """
             });
             formData.append('outputFormat', document.getElementById('outputFormat').value);
             formData.append('dateFormat', document.getElementById('dateFormat').value);
+            appendFilters(formData);
             try {
                 progressText.textContent = 'Uploading files...'; progressBar.style.width = '20%';
                 const response = await fetch('/process', { method: 'POST', body: formData });
@@ -788,23 +1523,310 @@ HTML_TEMPLATE = """
 </html>
 """
 
+CDN_FALLBACKS = {f"vendor/{name}": url for name, url in {**VENDOR_ASSETS, **FONT_STYLESHEETS}.items()}
+
+def asset(filename):
+    try:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        # Checkouts without bundled assets keep working from the CDN
+        fallback = CDN_FALLBACKS.get(filename)
+        print(f"Static asset missing: {filename} (run fetch_assets.py), using {fallback or 'local path'}")
+        return fallback or f"/static/{filename}"
+    return f"/static/{filename}?v={version}"
+
+RESPONSE_COMPRESSORS = {'gzip': lambda data: gzip.compress(data, compresslevel=6)}
+if brotli is not None:
+    RESPONSE_COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    RESPONSE_COMPRESSORS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/csv', 'application/json'}
+MIN_COMPRESS_SIZE = 1024
+
+def negotiate_encoding(available):
+    encoding = request.accept_encodings.best_match([enc for enc in ('br', 'zstd', 'gzip') if enc in available])
+    return encoding or 'identity'
+
+def build_cached_page(body):
+    body = body.encode('utf-8')
+    variants = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    if zstandard is not None:
+        variants['zstd'] = zstandard.ZstdCompressor(level=19).compress(body)
+    return {
+        'etag': hashlib.sha256(body).hexdigest()[:16],
+        'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+        'variants': variants
+    }
+
+def send_cached_page(page, mimetype='text/html'):
+    encoding = negotiate_encoding(page['variants'])
+    response = app.response_class(page['variants'][encoding], mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(page['etag'] if encoding == 'identity' else f"{page['etag']}-{encoding}")
+    response.last_modified = page['last_modified']
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+with app.app_context():
+    INDEX_PAGE = build_cached_page(render_template_string(HTML_TEMPLATE, asset=asset))
+
+# Rough peak-memory multipliers per uploaded byte: the raw upload, parsed
+# DataFrames, the consolidated frame and the serialized report are all alive
+# at the same time while a request runs.
+MEMORY_COST_FACTORS = {
+    '.xlsx': 40,
+    '.csv': 10,
+    '.json': 12,
+    '.gz': 80,
+    '.zst': 80,
+    '.zip': 60
+}
+DEFAULT_MEMORY_COST_FACTOR = 20
+PROCESS_POOL_COST_FACTOR = 15
+BASE_REQUEST_COST = 32 * 1024 * 1024
+
+def estimate_request_cost(files):
+    cost = BASE_REQUEST_COST
+    for file in files:
+        stream = file.stream
+        position = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(position)
+        ext = os.path.splitext(file.filename or '')[1].lower()
+        cost += size * MEMORY_COST_FACTORS.get(ext, DEFAULT_MEMORY_COST_FACTOR)
+        if app.config['PARSE_EXECUTOR'] == 'process':
+            # Pool children receive a pickled copy and send the parsed frames back
+            cost += size * PROCESS_POOL_COST_FACTOR
+    return cost
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def process_start_time(pid):
+    # Start time in clock ticks since boot; None where /proc is unavailable
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            return int(f.read().rsplit(b')', 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+process_identity = {'pid': None, 'instance': None, 'start': None}
+
+def current_process_identity():
+    # Regenerated after fork so every worker gets its own instance token
+    global process_identity
+    pid = os.getpid()
+    if process_identity['pid'] != pid:
+        process_identity = {'pid': pid, 'instance': uuid.uuid4().hex, 'start': process_start_time(pid)}
+    return process_identity
+
+class AdmissionController:
+    # Host-wide limit on concurrently running heavy requests, shared by every
+    # gunicorn worker through a small flock-protected state file. Waiters are
+    # admitted strictly in arrival order so large jobs are not starved. Entries
+    # left behind by killed workers are pruned by PID plus process start time,
+    # so a reused PID (e.g. after a container restart) does not keep them alive.
+    def __init__(self, state_path, memory_budget, max_concurrent, queue_size, queue_timeout, poll_interval=0.05):
+        self.state_path = state_path
+        self.memory_budget = memory_budget
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.poll_interval = poll_interval
+        self.local_lock = threading.Lock()
+        self.local_state = self.empty_state()
+
+    @staticmethod
+    def empty_state():
+        return {'active': {}, 'waiting': [], 'avg_duration': 5.0}
+
+    @contextlib.contextmanager
+    def locked_state(self):
+        if fcntl is None:
+            # No flock (Windows dev server): the budget only covers this process
+            with self.local_lock:
+                yield self.local_state
+            return
+        fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else self.empty_state()
+                except ValueError:
+                    state = self.empty_state()
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def owner_alive(self, job):
+        identity = current_process_identity()
+        if job['pid'] == identity['pid']:
+            return job.get('instance') == identity['instance']
+        if not process_alive(job['pid']):
+            return False
+        start = process_start_time(job['pid'])
+        return job.get('pid_start') is None or start is None or start == job['pid_start']
+
+    def prune(self, state):
+        state['active'] = {token: job for token, job in state['active'].items() if self.owner_alive(job)}
+        state['waiting'] = [job for job in state['waiting'] if self.owner_alive(job)]
+
+    def can_run(self, state, cost):
+        if len(state['active']) >= self.max_concurrent:
+            return False
+        # A job larger than the whole budget may still run on its own
+        memory_in_use = sum(job['cost'] for job in state['active'].values())
+        return memory_in_use + cost <= self.memory_budget or not state['active']
+
+    def retry_after(self, state):
+        # Time for the running jobs and the queue ahead to drain, from recent durations
+        backlog = len(state['active']) + len(state['waiting'])
+        estimate = state['avg_duration'] * max(backlog, 1) / max(self.max_concurrent, 1)
+        return max(1, min(int(math.ceil(estimate)), 300))
+
+    def acquire(self, cost):
+        token = uuid.uuid4().hex
+        identity = current_process_identity()
+        job = {'pid': identity['pid'], 'instance': identity['instance'], 'pid_start': identity['start'],
+               'cost': cost, 'started': None}
+        with self.locked_state() as state:
+            self.prune(state)
+            if not state['waiting'] and self.can_run(state, cost):
+                job['started'] = time.time()
+                state['active'][token] = job
+                return token
+            rejected = len(state['waiting']) >= self.queue_size
+            if rejected:
+                retry_after = self.retry_after(state)
+            else:
+                state['waiting'].append(dict(job, token=token))
+        if rejected:
+            raise AdmissionRejected('Server is busy, please retry shortly', retry_after)
+
+        deadline = time.time() + self.queue_timeout
+        while True:
+            time.sleep(self.poll_interval)
+            with self.locked_state() as state:
+                self.prune(state)
+                if state['waiting'] and state['waiting'][0]['token'] == token and self.can_run(state, cost):
+                    state['waiting'].pop(0)
+                    job['started'] = time.time()
+                    state['active'][token] = job
+                    return token
+                timed_out = time.time() >= deadline
+                if timed_out:
+                    state['waiting'] = [waiting for waiting in state['waiting'] if waiting['token'] != token]
+                    retry_after = self.retry_after(state)
+            if timed_out:
+                raise AdmissionRejected('Timed out waiting for processing capacity', retry_after)
+
+    def release(self, token):
+        with self.locked_state() as state:
+            job = state['active'].pop(token, None)
+            if job is not None:
+                duration = time.time() - job['started']
+                state['avg_duration'] = 0.8 * state['avg_duration'] + 0.2 * duration
+
+    def stats(self):
+        with self.locked_state() as state:
+            self.prune(state)
+            return {
+                'active': len(state['active']),
+                'waiting': len(state['waiting']),
+                'memory_in_use': sum(job['cost'] for job in state['active'].values()),
+                'memory_budget': self.memory_budget
+            }
+
+admission = AdmissionController(
+    state_path=app.config['ADMISSION_STATE_FILE'],
+    memory_budget=app.config['ADMISSION_MEMORY_BUDGET'],
+    max_concurrent=app.config['ADMISSION_MAX_CONCURRENT'],
+    queue_size=app.config['ADMISSION_QUEUE_SIZE'],
+    queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT']
+)
+
+def admission_controlled(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        cost = estimate_request_cost(request.files.getlist('files'))
+        try:
+            token = admission.acquire(cost)
+        except AdmissionRejected as e:
+            print(f"Rejected {request.path}: {e} (estimated cost {cost / 1024 / 1024:.0f}MB, {admission.stats()})")
+            response = jsonify({'error': str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        try:
+            return view(*args, **kwargs)
+        finally:
+            admission.release(token)
+    return wrapper
+
+@app.before_request
+def ensure_reference_watcher():
+    start_reference_watcher()
+
+@app.after_request
+def compress_response(response):
+    # Responses with an ETag manage their own encoded variants (send_cached_page);
+    # recompressing them here would serve different bytes under the same validator
+    if (response.direct_passthrough or response.status_code != 200
+            or 'Content-Encoding' in response.headers or 'ETag' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(RESPONSE_COMPRESSORS)
+    if encoding != 'identity':
+        response.set_data(RESPONSE_COMPRESSORS[encoding](data))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return send_cached_page(INDEX_PAGE)
 
 @app.route('/preview', methods=['POST'])
+@admission_controlled
 def preview():
     try:
         files_data = {}
         for file in request.files.getlist('files'):
             if file.filename:
                 filename = secure_filename(file.filename)
-                files_data[filename] = file.read()
+                files_data[filename] = file.stream
         
         if not files_data:
             return jsonify({'error': 'No files uploaded'}), 400
         
-        records_df = process_medical_claims(files_data)
+        records_df = process_medical_claims(files_data, filters=parse_filters(request.form))
         if records_df.empty:
             return jsonify({'error': 'No data could be processed'}), 400
         
@@ -813,17 +1835,22 @@ def preview():
         analytics['sample_claims'] = sample_claims
         
         return jsonify(analytics)
+    except InvalidFilter as e:
+        return jsonify({'error': str(e)}), 400
+    except DecompressedSizeExceeded as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/process', methods=['POST'])
+@admission_controlled
 def process():
     try:
         files_data = {}
         for file in request.files.getlist('files'):
             if file.filename:
                 filename = secure_filename(file.filename)
-                files_data[filename] = file.read()
+                files_data[filename] = file.stream
         
         if not files_data:
             return jsonify({'error': 'No files uploaded'}), 400
@@ -831,9 +1858,13 @@ def process():
         output_format = request.form.get('outputFormat', 'csv')
         date_format = request.form.get('dateFormat', 'YYYY-MM-DD')
         
-        result_df = process_medical_claims(files_data, date_format)
+        result_df = process_medical_claims(files_data, date_format, parse_filters(request.form))
         if result_df.empty:
             return jsonify({'error': 'No data could be processed'}), 400
+        try:
+            persist_claims(result_df, date_format)
+        except sqlite3.Error as e:
+            print(f"Error persisting claims to {app.config['CLAIMS_DB_PATH']}: {e}")
         
         output = io.BytesIO()
         if output_format == 'csv':
@@ -850,16 +1881,54 @@ def process():
             filename = 'medical_claims_report.json'
         else:
             return jsonify({'error': 'Invalid output format'}), 400
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype=mimetype,
-            as_attachment=True,
-            download_name=filename
-        )
+        response = app.response_class(output.getvalue(), mimetype=mimetype)
+        response.headers.set('Content-Disposition', 'attachment', filename=filename)
+        return response
+    except InvalidFilter as e:
+        return jsonify({'error': str(e)}), 400
+    except DecompressedSizeExceeded as e:
+        return jsonify({'error': str(e)}), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/claims', methods=['GET'])
+def claims():
+    try:
+        conn = get_claims_db()
+        if conn is None:
+            return jsonify({'error': 'Claim store is not configured (set CLAIMS_DB_PATH)'}), 404
+        try:
+            filters = parse_filters(request.args)
+            group_by = request.args.get('group_by')
+            if group_by:
+                if group_by not in CLAIM_STORE_GROUPS:
+                    return jsonify({'error': f"Invalid group_by, expected one of: {', '.join(CLAIM_STORE_GROUPS)}"}), 400
+                return jsonify(aggregate_claims(conn, filters, group_by))
+            page = max(request.args.get('page', 1, type=int), 1)
+            per_page = min(max(request.args.get('per_page', 50, type=int), 1), 1000)
+            return jsonify(query_claims(conn, filters, page, per_page))
+        finally:
+            conn.close()
+    except InvalidFilter as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/reference', methods=['GET'])
+def reference_status():
+    registry = reference_registry
+    if registry['data'] is None:
+        return jsonify({'configured': bool(app.config['REFERENCE_DIR']), 'version': 0})
+    return jsonify({
+        'configured': True,
+        'version': registry['version'],
+        'loaded_at': registry['loaded_at'],
+        'files': [name for name, _, _ in registry['signature']],
+        'procedures': len(registry['data']['procedures']),
+        'providers': len(registry['data']['providers']),
+        'facilities': len(registry['data']['facilities'])
+    })
+
 if __name__ == '__main__':
     required_packages = ['flask', 'pandas', 'openpyxl', 'werkzeug']
     print("Medical Claims File Processor")
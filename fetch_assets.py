@@ -0,0 +1,59 @@
+import os
+import re
+import sys
+import urllib.request
+
+VENDOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'vendor')
+
+# Google Fonts only serves woff2 to browsers it recognises
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+VENDOR_ASSETS = {
+    'tailwindcss.js': 'https://cdn.tailwindcss.com/3.4.1',
+    'materialize.min.css': 'https://cdnjs.cloudflare.com/ajax/libs/materialize/1.0.0/css/materialize.min.css',
+    'materialize.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/materialize/1.0.0/js/materialize.min.js',
+    'chart.umd.min.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js'
+}
+
+FONT_STYLESHEETS = {
+    'material-icons.css': 'https://fonts.googleapis.com/icon?family=Material+Icons',
+    'poppins.css': 'https://fonts.googleapis.com/css2?family=Poppins:wght@400;600;700&display=swap'
+}
+
+def download(url):
+    req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return resp.read()
+
+def save(filename, content):
+    path = os.path.join(VENDOR_DIR, filename)
+    with open(path, 'wb') as f:
+        f.write(content)
+    print(f"  {filename} ({len(content) / 1024:.1f} KB)")
+
+def fetch_font_stylesheet(filename, url):
+    css = download(url).decode('utf-8')
+    fonts_dir = os.path.join(VENDOR_DIR, 'fonts')
+    os.makedirs(fonts_dir, exist_ok=True)
+    for font_url in sorted(set(re.findall(r'url\((https://[^)]+)\)', css))):
+        font_name = re.sub(r'[^A-Za-z0-9._-]', '_', font_url.split('//', 1)[1])
+        save(os.path.join('fonts', font_name), download(font_url))
+        css = css.replace(font_url, f'fonts/{font_name}')
+    save(filename, css.encode('utf-8'))
+
+def main():
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    print(f"Fetching front-end assets into {VENDOR_DIR}")
+    try:
+        for filename, url in VENDOR_ASSETS.items():
+            save(filename, download(url))
+        for filename, url in FONT_STYLESHEETS.items():
+            fetch_font_stylesheet(filename, url)
+    except OSError as e:
+        print(f"Asset download failed: {e}")
+        return 1
+    print("Done. Commit or ship the static/vendor directory with the application.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
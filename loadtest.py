@@ -0,0 +1,299 @@
+import argparse
+import http.client
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(APP_DIR, 'loadtest_results')
+
+CPT_CODES = {
+    '99213': 'Office visit, established patient, low complexity',
+    '99214': 'Office visit, established patient, moderate complexity',
+    '93000': 'Electrocardiogram with interpretation',
+    '80053': 'Comprehensive metabolic panel',
+    '71046': 'Chest X-ray, 2 views'
+}
+SPECIALTIES = ['Cardiology', 'Family Medicine', 'Radiology', 'Internal Medicine', 'Pathology']
+STATES = ['CA', 'NY', 'TX', 'FL', 'WA', 'IL']
+
+def generate_upload_set(claims, seed=42):
+    rng = random.Random(seed)
+    facilities = {
+        f"FAC{i:03d}": {'name': f"Facility {i}", 'address': {'city': f"City {i}", 'state': rng.choice(STATES)}}
+        for i in range(20)
+    }
+    providers = [
+        {'npi': str(1000000000 + i), 'name': f"Dr. Provider {i}", 'specialty': rng.choice(SPECIALTIES), 'facility_id': rng.choice(list(facilities))}
+        for i in range(50)
+    ]
+    procedures = [{'code': code, 'description': desc} for code, desc in CPT_CODES.items()]
+    patient_count = max(1, claims // 4)
+    patients = [
+        {'patient_id': f"P{i:06d}", 'first_name': f"First{i}", 'last_name': f"Last{i}",
+         'dob': f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2015)}", 'gender': rng.choice('MF')}
+        for i in range(patient_count)
+    ]
+    records = []
+    for i in range(claims):
+        patient_id = f"P{rng.randrange(patient_count):06d}"
+        npi = rng.choice(providers)['npi']
+        service_date = f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2024"
+        for _ in range(rng.randint(1, 4)):
+            records.append({
+                'claim_id': f"CLM{i:07d}", 'patient_id': patient_id, 'cpt_code': rng.choice(list(CPT_CODES)),
+                'charge_amount': f"${rng.randint(20, 2000)}.00", 'rendering_npi': npi, 'date_of_service': service_date
+            })
+    workbook = io.BytesIO()
+    with pd.ExcelWriter(workbook, engine='openpyxl') as writer:
+        pd.DataFrame(records).to_excel(writer, sheet_name='claims', index=False)
+        pd.DataFrame(patients).to_excel(writer, sheet_name='patients', index=False)
+    return {
+        'records.xlsx': workbook.getvalue(),
+        'procedures.json': json.dumps(procedures).encode('utf-8'),
+        'providers.json': json.dumps(providers).encode('utf-8'),
+        'facilities.json': json.dumps(facilities).encode('utf-8')
+    }
+
+def encode_multipart(files, fields):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for filename, content in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'))
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode('utf-8'))
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(args, port):
+    cmd = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--chdir', APP_DIR,
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers),
+        '--worker-class', args.worker_class,
+        '--threads', str(args.threads),
+        '--timeout', str(args.timeout),
+        '--log-level', 'warning'
+    ]
+    if args.preload:
+        cmd.append('--preload')
+    print(f"Starting: {' '.join(cmd[2:])}")
+    server_log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=server_log)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            server_log.seek(0)
+            raise RuntimeError(f"gunicorn exited early: {server_log.read().decode('utf-8', 'replace')}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become ready within 60s")
+
+def process_tree(pid):
+    pids = [pid]
+    for child in read_children(pid):
+        pids.extend(process_tree(child))
+    return pids
+
+def read_children(pid):
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+def read_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+class RssSampler(threading.Thread):
+    # Polls /proc for the gunicorn workers (and their parse pools) while a level runs
+    def __init__(self, master_pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak_total_mb = 0.0
+        self.peak_worker_mb = 0.0
+        self.peak_pool_mb = 0.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            workers = read_children(self.master_pid)
+            worker_rss = []
+            pool_rss = 0.0
+            for worker in workers:
+                children_rss = sum(read_rss_mb(pid) for pid in process_tree(worker)[1:])
+                worker_rss.append(read_rss_mb(worker) + children_rss)
+                pool_rss += children_rss
+            if worker_rss:
+                self.peak_total_mb = max(self.peak_total_mb, sum(worker_rss))
+                self.peak_worker_mb = max(self.peak_worker_mb, max(worker_rss))
+                self.peak_pool_mb = max(self.peak_pool_mb, pool_rss)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def send_request(port, path, body, content_type, timeout):
+    start = time.perf_counter()
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        conn.request('POST', path, body=body, headers={'Content-Type': content_type, 'Accept-Encoding': 'gzip'})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return time.perf_counter() - start, response.status
+    except OSError as e:
+        return time.perf_counter() - start, type(e).__name__
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def run_level(port, master_pid, path, body, content_type, concurrency, total_requests, timeout):
+    sampler = RssSampler(master_pid)
+    sampler.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: send_request(port, path, body, content_type, timeout), range(total_requests)))
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+
+    latencies = sorted(latency for latency, status in results if status == 200)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = total_requests - len(latencies)
+    return {
+        'endpoint': path,
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        'error_rate': round(errors / total_requests, 4),
+        'statuses': statuses,
+        'peak_worker_rss_mb': round(sampler.peak_worker_mb, 1),
+        'peak_total_rss_mb': round(sampler.peak_total_mb, 1),
+        'peak_parse_pool_rss_mb': round(sampler.peak_pool_mb, 1)
+    }
+
+def print_level(result, baseline=None):
+    line = (f"{result['endpoint']:<9} c={result['concurrency']:<3} {result['requests_per_sec']:>7.2f} req/s  "
+            f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms  "
+            f"errors={result['error_rate']:.1%}  worker_rss={result['peak_worker_rss_mb']}MB (parse pools {result['peak_parse_pool_rss_mb']}MB)")
+    if baseline:
+        previous = baseline.get((result['endpoint'], result['concurrency']))
+        if previous and previous.get('p95_ms') and result['p95_ms']:
+            line += (f"  [vs baseline: {result['requests_per_sec'] - previous['requests_per_sec']:+.2f} req/s, "
+                     f"p95 {result['p95_ms'] - previous['p95_ms']:+.1f}ms]")
+    print(line)
+
+def load_baseline(path):
+    with open(path) as f:
+        previous = json.load(f)
+    return {(level['endpoint'], level['concurrency']): level for level in previous['results']}
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test /preview and /process under gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class (sync, gthread, ...)')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker (gthread)')
+    parser.add_argument('--preload', action='store_true', help='load the app before forking workers')
+    parser.add_argument('--timeout', type=int, default=120, help='gunicorn worker timeout in seconds')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=20, help='requests per endpoint and concurrency level')
+    parser.add_argument('--claims', type=int, default=2000, help='claims in the generated records workbook')
+    parser.add_argument('--endpoints', default='/preview,/process', help='comma-separated endpoints to exercise')
+    parser.add_argument('--output-format', default='csv', help='outputFormat sent to /process')
+    parser.add_argument('--label', default='', help='release label stored with the results')
+    parser.add_argument('--baseline', help='previous results file to compare against')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    endpoints = [endpoint.strip() for endpoint in args.endpoints.split(',') if endpoint.strip()]
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    print(f"Generating upload set with {args.claims} claims...")
+    upload_set = generate_upload_set(args.claims)
+    print(f"Upload size: {sum(len(content) for content in upload_set.values()) / 1024:.1f} KB")
+
+    port = free_port()
+    server = start_server(args, port)
+    results = []
+    try:
+        for endpoint in endpoints:
+            fields = {'outputFormat': args.output_format, 'dateFormat': 'YYYY-MM-DD'} if endpoint == '/process' else {}
+            body, content_type = encode_multipart(upload_set, fields)
+            send_request(port, endpoint, body, content_type, args.timeout)  # warm-up request, not measured
+            for concurrency in levels:
+                result = run_level(port, server.pid, endpoint, body, content_type, concurrency, args.requests, args.timeout)
+                results.append(result)
+                print_level(result, baseline)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    output_path = os.path.join(RESULTS_DIR, f"{timestamp}{'-' + args.label if args.label else ''}.json")
+    with open(output_path, 'w') as f:
+        json.dump({
+            'label': args.label,
+            'timestamp': timestamp,
+            'config': {
+                'workers': args.workers, 'worker_class': args.worker_class, 'threads': args.threads,
+                'preload': args.preload, 'claims': args.claims, 'requests': args.requests,
+                'upload_bytes': sum(len(content) for content in upload_set.values())
+            },
+            'results': results
+        }, f, indent=2)
+    print(f"Results saved to {output_path}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())